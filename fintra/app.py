@@ -2,17 +2,21 @@ import os
 import re
 import enum
 import json
+import asyncio
 
 import functools
 
-from typing import Any, Awaitable, Callable, ParamSpec, cast, TypeVar
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Awaitable, Callable, ParamSpec, cast, TypeVar
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+import psycopg
 
 from argon2 import PasswordHasher
 
 from jose import jwt, exceptions
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from prometheus_client import start_http_server, Summary
 from starlette.applications import Starlette
 from starlette.authentication import (
@@ -25,13 +29,18 @@ from starlette.authentication import (
 from starlette.datastructures import FormData
 from starlette.middleware import Middleware
 from starlette.middleware.authentication import AuthenticationMiddleware
-from starlette.responses import JSONResponse, RedirectResponse, Response
+from starlette.responses import (
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from starlette.requests import Request
 from starlette.routing import Route, Mount
 from starlette.staticfiles import StaticFiles
 from starlette.templating import _TemplateResponse, Jinja2Templates
 
-from fintra import db
+from fintra import archive, budgets, config, db, jobs, search, tracing
 
 
 REQUEST_TIME = Summary(
@@ -174,7 +183,10 @@ def async_timed(endpoint: str) -> Callable[[FuncType], FuncType]:
     def decorator(func: FuncType) -> FuncType:
         @functools.wraps(func)
         async def wrapped(*args: P.args, **kwargs: P.kwargs) -> object:
-            with REQUEST_TIME.labels(endpoint=endpoint).time():
+            with (
+                REQUEST_TIME.labels(endpoint=endpoint).time(),
+                tracing.span(f"handler.{endpoint}"),
+            ):
                 return await func(*args, **kwargs)
 
         return cast(FuncType, wrapped)
@@ -184,12 +196,13 @@ def async_timed(endpoint: str) -> Callable[[FuncType], FuncType]:
 
 @async_timed("health")
 async def health_check(_: Request):
-    conn = await db.create_or_return_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT 1;")
-        await cursor.fetchone()
+    for shard in range(len(db.SHARD_URLS)):
+        conn = await db.create_or_return_connection(shard)
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT 1;")
+            await cursor.fetchone()
 
-        return Response("hello there")
+    return Response("hello there")
 
 
 env = Environment(loader=FileSystemLoader("templates"))
@@ -206,10 +219,75 @@ async def join(request: Request) -> _TemplateResponse:
     return templates.TemplateResponse(request=request, name="join.html")
 
 
+# Archived months only leave their totals behind in transaction_summaries.
+BALANCE_QUERY = """
+    WITH u AS (SELECT id FROM users WHERE email = %(email)s)
+    SELECT
+        COALESCE((
+            SELECT
+                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) -
+                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END)
+            FROM transactions
+            WHERE user_id = (SELECT id FROM u)
+        ), 0) +
+        COALESCE((
+            SELECT SUM(income - expense)
+            FROM transaction_summaries
+            WHERE user_id = (SELECT id FROM u)
+        ), 0) AS balance;
+"""
+
+RECENT_TRANSACTIONS = 10
+
+# Separate from `env`: an async environment can't render synchronously.
+async_env = Environment(
+    loader=FileSystemLoader("templates"),
+    enable_async=True,
+    autoescape=select_autoescape(),
+)
+
+
+async def _fetch_balance(shard: int, email: str) -> float:
+    async with db.pooled_connection(shard) as conn:
+        cursor = await conn.execute(BALANCE_QUERY, {"email": email})
+        row = await cursor.fetchone()
+    return float(row[0]) if row else 0.0
+
+
+async def _fetch_user(shard: int, email: str) -> dict[str, Any]:
+    async with db.pooled_connection(shard) as conn:
+        query = """
+            SELECT username, created_at FROM users
+            WHERE email = %(email)s;
+        """
+        cursor = await conn.execute(query, {"email": email})
+        row = await cursor.fetchone()
+    username, created_at = row if row else (None, None)
+    return {"email": email, "username": username, "created_at": created_at}
+
+
+async def _fetch_recent(shard: int, email: str) -> list[dict[str, Any]]:
+    async with db.pooled_connection(shard) as conn, conn.cursor() as cursor:
+        return await archive.history(
+            cursor, email, None, None, limit=RECENT_TRANSACTIONS
+        )
+
+
 @async_timed("dashboard")
 @requires("authenticated")
-async def dashboard(request: Request) -> _TemplateResponse:
-    return templates.TemplateResponse(request=request, name="dashboard.html")
+async def dashboard(request: Request) -> StreamingResponse:
+    """Render the dashboard with its data so first paint needs one request."""
+    email, shard = request.user.username, request.user.shard
+    balance, user, recent = await asyncio.gather(
+        _fetch_balance(shard, email),
+        _fetch_user(shard, email),
+        _fetch_recent(shard, email),
+    )
+    template = async_env.get_template("dashboard.html")
+    chunks = template.generate_async(
+        request=request, user=user, balance=balance, transactions=recent
+    )
+    return StreamingResponse(chunks, media_type="text/html")
 
 
 @async_timed("create-user")
@@ -225,20 +303,28 @@ async def create_user(request: Request) -> RedirectResponse:
     if len(password) < 5:
         raise ValueError("password is too short")
     hashed = ph.hash(password=password, salt=generate_salt())
-    conn = await db.create_or_return_connection()
+    if await db.lookup_user(email):
+        raise ValueError("email already exists")
+    user_id = await db.allocate_user_id()
+    shard = db.shard_for_user(user_id)
+    conn = await db.create_or_return_connection(shard)
     async with conn.cursor() as cursor:
         query = """
-            SELECT email FROM users
-            WHERE email = %(email)s;
+            INSERT INTO users (id, email, password)
+            VALUES (%(id)s, %(email)s, %(password)s);
         """
-        await cursor.execute(query, params={"email": email})
-        if await cursor.fetchone():
+        await cursor.execute(
+            query=query, params={"id": user_id, "email": email, "password": hashed}
+        )
+        # The directory is the source of truth, so a user only exists once it
+        # is registered there; undo the shard row if another signup won.
+        try:
+            await db.register_user(email, user_id, shard)
+        except psycopg.errors.UniqueViolation:
+            await cursor.execute(
+                "DELETE FROM users WHERE id = %(id)s;", params={"id": user_id}
+            )
             raise ValueError("email already exists")
-        query = """
-            INSERT INTO users (email, password)
-            VALUES (%(email)s, %(password)s);
-        """
-        await cursor.execute(query=query, params={"email": email, "password": hashed})
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": email}, expires_delta=access_token_expires
@@ -258,8 +344,19 @@ async def create_user(request: Request) -> RedirectResponse:
     return response
 
 
+class ShardUser(SimpleUser):
+    def __init__(self, username: str, user_id: int, shard: int) -> None:
+        super().__init__(username)
+        self.user_id = user_id
+        self.shard = shard
+
+
 class TokenAuthBackend(AuthenticationBackend):
     async def authenticate(self, conn):
+        with tracing.span("auth.authenticate"):
+            return await self._authenticate(conn)
+
+    async def _authenticate(self, conn):
         # Check for 'access_token' cookie
         token = conn.cookies.get("access_token")
         if not token:
@@ -273,17 +370,13 @@ class TokenAuthBackend(AuthenticationBackend):
         if not email:
             return
 
-        conn = await db.create_or_return_connection()
-        async with conn.cursor() as cursor:
-            query = """
-                SELECT email FROM users
-                WHERE email = %(email)s;
-            """
-            await cursor.execute(query, params={"email": email})
-            result = await cursor.fetchone()
-            if not result:
-                return
-        return AuthCredentials(["authenticated"]), SimpleUser(email)
+        if not (found := await db.lookup_user(email)):
+            return
+        user_id, shard = found
+        scopes = ["authenticated"]
+        if email in config.DEBUG_EMAILS:
+            scopes.append("debug")
+        return AuthCredentials(scopes), ShardUser(email, user_id, shard)
 
 
 @async_timed("login")
@@ -304,7 +397,10 @@ async def authorize(request: Request) -> RedirectResponse:
     if not EMAIL_PATTERN.search(str(email)):
         raise ValueError("email is in wrong format")
 
-    conn = await db.create_or_return_connection()
+    if not (found := await db.lookup_user(email)):
+        raise Exception("user does not exist")
+    _, shard = found
+    conn = await db.create_or_return_connection(shard)
     async with conn.cursor() as cursor:
         query = """
             SELECT password FROM users
@@ -357,38 +453,149 @@ async def logout(request: Request) -> RedirectResponse:
     return response
 
 
+def user_moved() -> Response:
+    """The user was moved to another shard while this request was writing.
+
+    Nothing was written. A retry authenticates again and is routed to the
+    user's new shard.
+    """
+    return Response(status_code=503, headers={"Retry-After": "1"})
+
+
 @async_timed("transaction")
 @requires("authenticated")
 async def transaction(request: Request) -> Response:
-    transaction = Transaction.from_request_body(await request.body())
-    conn = await db.create_or_return_connection()
+    body = await request.body()
+    with tracing.span("transaction.parse"):
+        transaction = Transaction.from_request_body(body)
+    conn = await db.create_or_return_connection(request.user.shard)
     async with conn.cursor() as cursor:
+        # The spend counter is bumped in the same statement as the insert, so
+        # the two can never disagree.
         query = """
-            INSERT INTO transactions (amount, type, category, description, party, date, user_id)
-            SELECT %(amount)s, %(type)s, %(category)s, %(description)s, %(party)s, %(date)s, users.id
-            FROM users
-            WHERE users.email = %(email)s
+            WITH inserted AS (
+                INSERT INTO transactions (amount, type, category, description, party, date, user_id)
+                SELECT %(amount)s, %(type)s, %(category)s, %(description)s, %(party)s, %(date)s, users.id
+                FROM users
+                WHERE users.email = %(email)s
+                RETURNING user_id, category, amount, type, date
+            ),
+            spend AS (
+                INSERT INTO budget_spend (user_id, category, month, spent)
+                SELECT user_id, category, date_trunc('month', date)::date, amount
+                FROM inserted
+                WHERE type = 'expense' AND category IS NOT NULL
+                ON CONFLICT (user_id, category, month)
+                DO UPDATE SET spent = budget_spend.spent + EXCLUDED.spent
+                RETURNING user_id, category, month, spent
+            )
+            SELECT spend.user_id, spend.category, spend.month, spend.spent, budgets.amount
+            FROM inserted
+            LEFT JOIN spend ON true
+            LEFT JOIN budgets
+                ON budgets.user_id = spend.user_id
+                AND budgets.category = spend.category;
         """
         params = transaction.as_dict()
         params["email"] = request.user.username
-        await cursor.execute(query, params=params)
+        try:
+            await cursor.execute(query, params=params)
+        except psycopg.errors.ForeignKeyViolation:
+            return user_moved()
+        if (row := await cursor.fetchone()) is None:
+            return user_moved()
+        user_id, category, month, spent, limit = row
+        if limit is not None:
+            await budgets.record_alerts(cursor, user_id, category, month, spent, limit)
+    search.autocomplete.remember(request.user.username, params)
     return Response(status_code=201)
 
 
+@async_timed("history")
+@requires("authenticated")
+async def history(request: Request) -> JSONResponse:
+    start = end = None
+    if raw_start := request.query_params.get("start"):
+        start = datetime.fromisoformat(raw_start)
+    if raw_end := request.query_params.get("end"):
+        end = datetime.fromisoformat(raw_end)
+    limit = max(
+        1, min(int(request.query_params.get("limit", 50)), config.SEARCH_MAX_RESULTS)
+    )
+    conn = await db.create_or_return_connection(request.user.shard)
+    async with conn.cursor() as cursor:
+        results = await archive.history(
+            cursor, request.user.username, start, end, limit
+        )
+    return JSONResponse({"transactions": results})
+
+
+@async_timed("search")
+@requires("authenticated")
+async def search_transactions(request: Request) -> JSONResponse:
+    if not (query := request.query_params.get("q", "").strip()):
+        raise ValueError("no search query provided")
+    limit = max(
+        1, min(int(request.query_params.get("limit", 50)), config.SEARCH_MAX_RESULTS)
+    )
+    conn = await db.create_or_return_connection(request.user.shard)
+    async with conn.cursor() as cursor:
+        results = await search.search_transactions(
+            cursor, request.user.username, query, limit
+        )
+    return JSONResponse({"transactions": results})
+
+
+@async_timed("autocomplete")
+@requires("authenticated")
+async def autocomplete(request: Request) -> JSONResponse:
+    field = request.query_params.get("field")
+    if field not in search.AUTOCOMPLETE_FIELDS:
+        raise ValueError(f"field must be one of {list(search.AUTOCOMPLETE_FIELDS)}")
+    prefix = request.query_params.get("prefix", "")
+    conn = await db.create_or_return_connection(request.user.shard)
+    async with conn.cursor() as cursor:
+        indexes = await search.autocomplete.get(cursor, request.user.username)
+    return JSONResponse({"suggestions": indexes[field].complete(prefix)})
+
+
+@async_timed("budgets")
+@requires("authenticated")
+async def list_budgets(request: Request) -> JSONResponse:
+    conn = await db.create_or_return_connection(request.user.shard)
+    async with conn.cursor() as cursor:
+        result = await budgets.list_budgets(
+            cursor, request.user.username, date.today().replace(day=1)
+        )
+    return JSONResponse({"budgets": result})
+
+
+@async_timed("set-budget")
+@requires("authenticated")
+async def set_budget(request: Request) -> Response:
+    body = json.loads(await request.body())
+    if not (category := body.get("category")):
+        raise ValueError("Can't set budget without category")
+    if not (amount := body.get("amount")):
+        raise ValueError("Can't set budget without amount")
+    conn = await db.create_or_return_connection(request.user.shard)
+    async with conn.cursor() as cursor:
+        try:
+            if not await budgets.set_budget(
+                cursor, request.user.username, category, amount
+            ):
+                return user_moved()
+        except psycopg.errors.ForeignKeyViolation:
+            return user_moved()
+    return Response(status_code=204)
+
+
 @async_timed("balance")
 @requires("authenticated")
 async def balance(request: Request) -> JSONResponse | Response:
-    conn = await db.create_or_return_connection()
+    conn = await db.create_or_return_connection(request.user.shard)
     async with conn.cursor() as cursor:
-        query = """
-            SELECT
-                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) -
-                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) AS balance
-            FROM transactions
-            JOIN users on transactions.user_id = users.id
-            WHERE users.email = %(email)s;
-        """
-        await cursor.execute(query, params={"email": request.user.username})
+        await cursor.execute(BALANCE_QUERY, params={"email": request.user.username})
         if not (row := await cursor.fetchone()):
             return Response(status_code=500)
         balance = row[0]
@@ -398,7 +605,29 @@ async def balance(request: Request) -> JSONResponse | Response:
     return JSONResponse(content={}, status_code=404)
 
 
-middleware = [Middleware(AuthenticationMiddleware, backend=TokenAuthBackend())]
+@async_timed("slow-queries")
+@requires("debug")
+async def slow_queries(request: Request) -> JSONResponse:
+    entries = [
+        {
+            "statement": entry.statement,
+            "params": entry.params,
+            "duration": entry.duration,
+            "at": entry.at.isoformat(),
+            "plan": entry.plan,
+        }
+        for entry in reversed(db.slow_queries.entries)
+    ]
+    return JSONResponse({"slow_queries": entries})
+
+
+if config.TRACE_FILE:
+    tracing.exporters.append(tracing.OtlpJsonFileExporter(config.TRACE_FILE))
+
+middleware = [
+    Middleware(tracing.TracingMiddleware, sample_rate=config.TRACE_SAMPLE_RATE),
+    Middleware(AuthenticationMiddleware, backend=TokenAuthBackend()),
+]
 
 routes = [
     Route("/health", endpoint=health_check, methods=["GET"]),
@@ -407,13 +636,34 @@ routes = [
     Route("/login", endpoint=login, methods=["GET"]),
     Route("/dashboard", endpoint=dashboard, methods=["GET"]),
     Route("/transaction", endpoint=transaction, methods=["POST"]),
+    Route("/transactions", endpoint=history, methods=["GET"]),
+    Route("/transactions/search", endpoint=search_transactions, methods=["GET"]),
+    Route("/transactions/autocomplete", endpoint=autocomplete, methods=["GET"]),
     Route("/balance", endpoint=balance, methods=["GET"]),
+    Route("/budgets", endpoint=list_budgets, methods=["GET"]),
+    Route("/budgets", endpoint=set_budget, methods=["POST"]),
     Route("/create-user", create_user, methods=["POST"]),
+    Route("/debug/slow-queries", slow_queries, methods=["GET"]),
     Route("/logout", logout, methods=["POST"]),
     Route("/", endpoint=index, methods=["GET"]),
     Mount("/static", app=StaticFiles(directory="static"), name="static")
 ]
 
 
-app = Starlette(routes=routes, middleware=middleware)
+scheduler = jobs.create_scheduler()
+
+
+@asynccontextmanager
+async def lifespan(_: Starlette) -> AsyncGenerator[None, None]:
+    if config.SCHEDULER_ENABLED:
+        await scheduler.start()
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        await db.close_pools()
+        await tracing.flush()
+
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
 metrics_app = start_http_server(port=8001)
@@ -0,0 +1,148 @@
+from datetime import date, datetime
+from typing import Any
+
+from prometheus_client import Counter
+from psycopg import AsyncCursor
+
+
+ARCHIVED_ROWS = Counter("archived_transactions", "Transactions moved to the archive")
+
+# Archived transactions as rows, with the same columns as `transactions`.
+# Each archive row holds one user-month as parallel arrays; Postgres compresses
+# them out of line, so the archive is a fraction of the hot table's size.
+ARCHIVED_TRANSACTIONS = """
+    SELECT
+        transactions_archive.user_id,
+        transactions_archive.month,
+        t.amount, t.type, t.category, t.description, t.party, t.date
+    FROM transactions_archive,
+        unnest(amounts, types, categories, descriptions, parties, dates)
+            AS t(amount, type, category, description, party, date)
+"""
+
+
+def month_start(months_ago: int, today: date | None = None) -> date:
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - months_ago
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def archive_before(cursor: AsyncCursor, cutoff: date, batch_size: int) -> int:
+    """Move one batch of transactions dated before `cutoff` into the archive.
+
+    Rows are deleted, archived and summarised in a single statement, so a
+    reader sees them either in the hot table or in the archive and summary
+    tables, never both or neither. Batches are taken oldest first through
+    transactions_date_idx. Returns the number of rows moved.
+    """
+    query = """
+        WITH moved AS (
+            DELETE FROM transactions
+            WHERE id IN (
+                SELECT id FROM transactions
+                WHERE date < %(cutoff)s
+                ORDER BY date
+                LIMIT %(batch_size)s
+            )
+            RETURNING user_id, amount, type, category, description, party, date
+        ),
+        archived AS (
+            INSERT INTO transactions_archive (
+                user_id, month, amounts, types, categories, descriptions, parties, dates
+            )
+            SELECT
+                user_id,
+                date_trunc('month', date)::date,
+                array_agg(amount ORDER BY date),
+                array_agg(type ORDER BY date),
+                array_agg(category ORDER BY date),
+                array_agg(description ORDER BY date),
+                array_agg(party ORDER BY date),
+                array_agg(date ORDER BY date)
+            FROM moved
+            GROUP BY 1, 2
+            ON CONFLICT (user_id, month) DO UPDATE SET
+                amounts = transactions_archive.amounts || EXCLUDED.amounts,
+                types = transactions_archive.types || EXCLUDED.types,
+                categories = transactions_archive.categories || EXCLUDED.categories,
+                descriptions = transactions_archive.descriptions || EXCLUDED.descriptions,
+                parties = transactions_archive.parties || EXCLUDED.parties,
+                dates = transactions_archive.dates || EXCLUDED.dates
+        ),
+        summarised AS (
+            INSERT INTO transaction_summaries (user_id, month, income, expense, count)
+            SELECT
+                user_id,
+                date_trunc('month', date)::date,
+                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                COUNT(*)
+            FROM moved
+            GROUP BY 1, 2
+            ON CONFLICT (user_id, month) DO UPDATE SET
+                income = transaction_summaries.income + EXCLUDED.income,
+                expense = transaction_summaries.expense + EXCLUDED.expense,
+                count = transaction_summaries.count + EXCLUDED.count
+        )
+        SELECT COUNT(*) FROM moved;
+    """
+    await cursor.execute(query, params={"cutoff": cutoff, "batch_size": batch_size})
+    row = await cursor.fetchone()
+    moved = row[0] if row else 0
+    ARCHIVED_ROWS.inc(moved)
+    return moved
+
+
+async def history(
+    cursor: AsyncCursor,
+    email: str,
+    start: datetime | None,
+    end: datetime | None,
+    limit: int,
+) -> list[dict[str, Any]]:
+    """Transactions in [start, end), newest first, from hot and archived rows.
+
+    The archive side is narrowed by month on its primary key first, so a
+    range that doesn't reach into the archive costs one empty index probe.
+    """
+    query = f"""
+        WITH u AS (SELECT id FROM users WHERE email = %(email)s)
+        SELECT amount, type, category, description, party, date FROM (
+            SELECT amount, type, category, description, party, date
+            FROM transactions
+            WHERE user_id = (SELECT id FROM u)
+                AND (%(start)s::timestamp IS NULL OR date >= %(start)s)
+                AND (%(end)s::timestamp IS NULL OR date < %(end)s)
+            UNION ALL
+            SELECT amount, type, category, description, party, date
+            FROM ({ARCHIVED_TRANSACTIONS}
+                WHERE transactions_archive.user_id = (SELECT id FROM u)
+                    AND (
+                        %(start)s::timestamp IS NULL
+                        OR transactions_archive.month >= date_trunc('month', %(start)s::timestamp)
+                    )
+                    AND (
+                        %(end)s::timestamp IS NULL
+                        OR transactions_archive.month < %(end)s
+                    )
+            ) archived
+            WHERE (%(start)s::timestamp IS NULL OR date >= %(start)s)
+                AND (%(end)s::timestamp IS NULL OR date < %(end)s)
+        ) combined
+        ORDER BY date DESC
+        LIMIT %(limit)s;
+    """
+    await cursor.execute(
+        query, params={"email": email, "start": start, "end": end, "limit": limit}
+    )
+    return [
+        {
+            "amount": float(amount),
+            "type": _type,
+            "category": category,
+            "description": description,
+            "party": party,
+            "date": when.isoformat(),
+        }
+        for amount, _type, category, description, party, when in await cursor.fetchall()
+    ]
@@ -0,0 +1,114 @@
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+from prometheus_client import Counter
+from psycopg import AsyncCursor
+
+from fintra import config
+
+
+BUDGET_ALERTS = Counter(
+    "budget_alerts", "Budget thresholds crossed at write time", ["threshold"]
+)
+
+
+def reached_thresholds(
+    current: float, limit: float, thresholds: tuple[float, ...]
+) -> list[float]:
+    """Return the thresholds (fractions of `limit`) that `current` has reached."""
+    return [t for t in thresholds if limit * t <= current]
+
+
+async def record_alerts(
+    cursor: AsyncCursor,
+    user_id: int,
+    category: str,
+    month: date,
+    spent: Decimal,
+    limit: Decimal,
+) -> list[float]:
+    """Record every threshold that month-to-date spend has reached.
+
+    Alerts are kept once per budget, month and threshold, so thresholds passed
+    before the budget was set or lowered are caught up on the next expense.
+    Returns only the thresholds that were newly recorded.
+    """
+    recorded = []
+    for threshold in reached_thresholds(
+        float(spent), float(limit), config.BUDGET_ALERT_THRESHOLDS
+    ):
+        query = """
+            INSERT INTO budget_alerts (user_id, category, month, threshold)
+            VALUES (%(user_id)s, %(category)s, %(month)s, %(threshold)s)
+            ON CONFLICT DO NOTHING;
+        """
+        await cursor.execute(
+            query,
+            params={
+                "user_id": user_id,
+                "category": category,
+                "month": month,
+                "threshold": threshold,
+            },
+        )
+        if cursor.rowcount:
+            BUDGET_ALERTS.labels(threshold=str(threshold)).inc()
+            recorded.append(threshold)
+    return recorded
+
+
+async def set_budget(
+    cursor: AsyncCursor, email: str, category: str, amount: float
+) -> bool:
+    """Create or update a budget; False if the user isn't on this shard."""
+    query = """
+        INSERT INTO budgets (user_id, category, amount)
+        SELECT users.id, %(category)s, %(amount)s
+        FROM users
+        WHERE users.email = %(email)s
+        ON CONFLICT (user_id, category)
+        DO UPDATE SET amount = EXCLUDED.amount;
+    """
+    await cursor.execute(
+        query, params={"email": email, "category": category, "amount": amount}
+    )
+    return cursor.rowcount > 0
+
+
+async def list_budgets(
+    cursor: AsyncCursor, email: str, month: date
+) -> list[dict[str, Any]]:
+    """Read budgets with their month-to-date spend; never touches transactions."""
+    query = """
+        SELECT
+            budgets.category,
+            budgets.amount,
+            COALESCE(budget_spend.spent, 0),
+            ARRAY(
+                SELECT threshold FROM budget_alerts
+                WHERE budget_alerts.user_id = budgets.user_id
+                    AND budget_alerts.category = budgets.category
+                    AND budget_alerts.month = %(month)s
+                ORDER BY threshold
+            )
+        FROM budgets
+        JOIN users ON budgets.user_id = users.id
+        LEFT JOIN budget_spend
+            ON budget_spend.user_id = budgets.user_id
+            AND budget_spend.category = budgets.category
+            AND budget_spend.month = %(month)s
+        WHERE users.email = %(email)s
+        ORDER BY budgets.category;
+    """
+    await cursor.execute(query, params={"email": email, "month": month})
+    return [
+        {
+            "category": category,
+            "limit": float(limit),
+            "spent": float(spent),
+            "remaining": float(limit - spent),
+            "alerts": [float(t) for t in alerts],
+        }
+        for category, limit, spent, alerts in await cursor.fetchall()
+    ]
@@ -0,0 +1,50 @@
+import os
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Background jobs
+SCHEDULER_ENABLED = _env_bool("SCHEDULER_ENABLED", True)
+SCHEDULER_LOCK_KEY = int(os.getenv("SCHEDULER_LOCK_KEY", "727001"))
+SCHEDULER_RETRY_SECONDS = float(os.getenv("SCHEDULER_RETRY_SECONDS", "30"))
+ANALYZE_INTERVAL_SECONDS = float(os.getenv("ANALYZE_INTERVAL_SECONDS", "3600"))
+ANALYZE_TIMEOUT_SECONDS = float(os.getenv("ANALYZE_TIMEOUT_SECONDS", "300"))
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECONCILE_INTERVAL_SECONDS", "900"))
+RECONCILE_TIMEOUT_SECONDS = float(os.getenv("RECONCILE_TIMEOUT_SECONDS", "120"))
+
+# Budgets
+BUDGET_ALERT_THRESHOLDS = tuple(
+    sorted(
+        float(t) for t in os.getenv("BUDGET_ALERT_THRESHOLDS", "0.8,1.0").split(",")
+    )
+)
+
+# Search
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "200"))
+AUTOCOMPLETE_MAX_USERS = int(os.getenv("AUTOCOMPLETE_MAX_USERS", "10000"))
+
+# Profiling
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.2"))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.05"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+DEBUG_EMAILS = frozenset(
+    email.strip() for email in os.getenv("DEBUG_EMAILS", "").split(",") if email.strip()
+)
+
+# Tracing
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+# Archival
+ARCHIVE_AFTER_MONTHS = max(1, int(os.getenv("ARCHIVE_AFTER_MONTHS", "12")))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "10000"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "86400"))
+ARCHIVE_TIMEOUT_SECONDS = float(os.getenv("ARCHIVE_TIMEOUT_SECONDS", "1800"))
+
+# Connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
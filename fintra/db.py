@@ -1,39 +1,381 @@
+import asyncio
+import hashlib
+import logging
 import os
+import random
+import re
+import time
 
-from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from collections import deque
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncGenerator
 
 import psycopg
+from prometheus_client import Counter, Summary
+from psycopg.conninfo import make_conninfo
 from psycopg.rows import TupleRow
 
-from psycopg import AsyncConnection, AsyncCursor
+from psycopg import AsyncConnection, AsyncCursor, sql
+
+from fintra import config, tracing
 
 DATABASE_URL = os.environ["DATABASE_URL"]
+# Users are spread across these databases; the first also holds the directory.
+SHARD_URLS = [
+    url.strip()
+    for url in os.getenv("SHARD_URLS", DATABASE_URL).split(",")
+    if url.strip()
+]
+DIRECTORY_SHARD = 0
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_TIME = Summary(
+    "slow_query_seconds", "Statements over the slow threshold", ["operation"]
+)
+QUERY_EXPLAINS = Counter("slow_query_explains", "Sampled EXPLAIN runs")
+
+EXPLAINABLE = {"select", "insert", "update", "delete", "with", "values", "merge"}
+# Also matches data-modifying CTEs and SELECT ... FOR UPDATE, which lock rows.
+WRITES = re.compile(r"\b(insert|update|delete|merge)\b", re.IGNORECASE)
+
+
+def query_text(conn: AsyncConnection, query: Any) -> str:
+    """Render a query as one line of SQL, including composed ones."""
+    if isinstance(query, sql.Composable):
+        query = query.as_string(conn)
+    elif isinstance(query, bytes):
+        query = query.decode()
+    return " ".join(query.split())
+
+
+def params_shape(params: Any) -> Any:
+    """Describe parameters by name and type, never by value."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
 
-# TODO: implement a connection pool
-_connection: AsyncConnection | None = None
+
+@dataclass
+class SlowQuery:
+    statement: str
+    params: Any
+    duration: float
+    at: datetime = field(default_factory=datetime.now)
+    plan: str | None = None
+
+
+class SlowQueryLog:
+    """Bounded log of slow statements, with a sample of them explained.
+
+    Sampled reads are re-run under EXPLAIN (ANALYZE, BUFFERS) on a separate
+    connection. Writes only get a plain EXPLAIN: executing them again, even in
+    a transaction that is rolled back, would hold real row locks for as long
+    as the original took. At most one EXPLAIN runs at a time.
+    """
+
+    def __init__(self, threshold: float, explain_rate: float, size: int) -> None:
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.entries: deque[SlowQuery] = deque(maxlen=size)
+        self._explain_task: asyncio.Task | None = None
+
+    def observe(
+        self, conn: AsyncConnection, query: Any, params: Any, duration: float
+    ) -> None:
+        if duration < self.threshold:
+            return
+        statement = query_text(conn, query)
+        operation = statement.split(" ", 1)[0].lower()
+        entry = SlowQuery(
+            statement=statement, params=params_shape(params), duration=duration
+        )
+        self.entries.append(entry)
+        SLOW_QUERY_TIME.labels(operation=operation).observe(duration)
+        logger.warning("slow query (%.3fs): %s", duration, statement)
+        if (
+            operation in EXPLAINABLE
+            and random.random() < self.explain_rate
+            and (self._explain_task is None or self._explain_task.done())
+        ):
+            conninfo = make_conninfo(conn.info.dsn, password=conn.info.password)
+            self._explain_task = asyncio.create_task(
+                self._explain(
+                    entry, conninfo, query, params, analyze=not WRITES.search(statement)
+                )
+            )
+
+    async def _explain(
+        self,
+        entry: SlowQuery,
+        conninfo: str,
+        query: Any,
+        params: Any,
+        analyze: bool,
+    ) -> None:
+        QUERY_EXPLAINS.inc()
+        try:
+            async with (
+                await psycopg.AsyncConnection.connect(conninfo) as conn,
+                conn.transaction(force_rollback=True),
+            ):
+                if isinstance(query, bytes):
+                    query = query.decode()
+                if not isinstance(query, sql.Composable):
+                    query = sql.SQL(query)
+                explain = "EXPLAIN (ANALYZE, BUFFERS) {}" if analyze else "EXPLAIN {}"
+                cursor = await conn.execute(sql.SQL(explain).format(query), params)
+                entry.plan = "\n".join(row[0] for row in await cursor.fetchall())
+        except psycopg.Error as e:
+            entry.plan = f"EXPLAIN failed: {e}"
 
 
-async def _create_connection() -> psycopg.AsyncConnection:
+slow_queries = SlowQueryLog(
+    threshold=config.SLOW_QUERY_SECONDS,
+    explain_rate=config.SLOW_QUERY_EXPLAIN_RATE,
+    size=config.SLOW_QUERY_LOG_SIZE,
+)
+
+
+class TimedCursor(AsyncCursor[TupleRow]):
+    async def execute(self, query, params=None, *, prepare=None, binary=None):
+        start = time.perf_counter()
+        with tracing.span("db.execute") as span:
+            if span.recording:
+                span.set_attribute(
+                    "db.statement", query_text(self.connection, query)
+                )
+            try:
+                return await super().execute(
+                    query, params, prepare=prepare, binary=binary
+                )
+            finally:
+                slow_queries.observe(
+                    self.connection, query, params, time.perf_counter() - start
+                )
+
+
+# One shared connection per shard; ConnectionPool below is for concurrent work.
+_connections: dict[int, AsyncConnection] = {}
+
+
+async def _create_connection(
+    shard: int = DIRECTORY_SHARD,
+) -> psycopg.AsyncConnection:
     """Create a new async database connection."""
-    return await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True)
+    return await psycopg.AsyncConnection.connect(
+        SHARD_URLS[shard], autocommit=True, cursor_factory=TimedCursor
+    )
 
 
-async def create_or_return_connection() -> psycopg.AsyncConnection:
-    global _connection
-    if _connection is None or _connection.closed:
-        _connection = await _create_connection()
-    return _connection
+async def create_or_return_connection(
+    shard: int = DIRECTORY_SHARD,
+) -> psycopg.AsyncConnection:
+    conn = _connections.get(shard)
+    if conn is None or conn.closed:
+        with tracing.span("db.connect", shard=shard):
+            conn = _connections[shard] = await _create_connection(shard)
+    return conn
 
 
 @asynccontextmanager
-async def connect_with_lock(
-    lock_key: int,
-) -> AsyncGenerator[AsyncCursor[TupleRow], None]:
-    conn = await create_or_return_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT pg_try_advisory_lock(%s::bigint)", (lock_key,))
+async def dedicated_connection(
+    shard: int = DIRECTORY_SHARD,
+) -> AsyncGenerator[AsyncConnection, None]:
+    """A connection of its own, closed on exit.
+
+    For long-running statements that would otherwise hold up every request
+    queued on the shared connection.
+    """
+    conn = await _create_connection(shard)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+class ConnectionPool:
+    """Up to `size` connections to one shard, each used by one task at a time.
+
+    The shared connection serialises every statement; this is for callers
+    that want several queries in flight at once. Idle connections are checked
+    before reuse, so a database restart doesn't fail the next request.
+    """
+
+    def __init__(self, shard: int, size: int) -> None:
+        self.shard = shard
+        self.size = size
+        self._idle: list[AsyncConnection] = []
+        self._opened = 0
+        self._closed = False
+        self._available = asyncio.Condition()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncGenerator[AsyncConnection, None]:
+        async with self._available:
+            await self._available.wait_for(
+                lambda: self._idle or self._opened < self.size
+            )
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._opened += 1
         try:
-            yield cursor
+            if conn is not None and not await _is_alive(conn):
+                conn = None
+            if conn is None:
+                with tracing.span("db.connect", shard=self.shard):
+                    conn = await _create_connection(self.shard)
+            yield conn
+        except BaseException:
+            if conn is not None and not conn.closed:
+                await conn.close()
+            conn = None
+            raise
         finally:
-            await cursor.execute("SELECT pg_advisory_unlock(%s::bigint)", (lock_key,))
+            async with self._available:
+                keep = conn is not None and not conn.broken and not self._closed
+                if keep:
+                    self._idle.append(conn)
+                else:
+                    self._opened -= 1
+                self._available.notify()
+            # Connections returned after close() are closed rather than kept.
+            if not keep and conn is not None and not conn.closed:
+                await conn.close()
+
+    async def close(self) -> None:
+        async with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for conn in idle:
+            await conn.close()
+
+
+async def _is_alive(conn: AsyncConnection) -> bool:
+    """Round-trip an empty query; closes the connection if it fails."""
+    if conn.closed:
+        return False
+    try:
+        # A plain cursor, so health checks stay out of traces and the slow log.
+        async with AsyncCursor(conn) as cursor:
+            await cursor.execute("")
+    except psycopg.Error:
+        await conn.close()
+        return False
+    return True
+
+
+_pools: dict[int, ConnectionPool] = {}
+
+
+def pooled_connection(
+    shard: int = DIRECTORY_SHARD,
+) -> AbstractAsyncContextManager[AsyncConnection]:
+    if (pool := _pools.get(shard)) is None:
+        pool = _pools[shard] = ConnectionPool(shard, config.DB_POOL_SIZE)
+    return pool.connection()
+
+
+async def close_pools() -> None:
+    # Later callers get fresh pools, e.g. when the app is started again.
+    while _pools:
+        _, pool = _pools.popitem()
+        await pool.close()
+
+
+def shard_for_user(user_id: int, shards: int | None = None) -> int:
+    """Placement for new users; existing users are found via the directory.
+
+    Uses jump consistent hashing (Lamping & Veach), so appending a shard to
+    SHARD_URLS moves only about 1/N of users, all of them to the new shard.
+    Shards must only be added or removed at the end of the list.
+    """
+    digest = hashlib.blake2b(user_id.to_bytes(8, "big"), digest_size=8).digest()
+    key = int.from_bytes(digest, "big")
+    shards = shards or len(SHARD_URLS)
+    bucket, candidate = -1, 0
+    while candidate < shards:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) % 2**64
+        candidate = int((bucket + 1) * (2**31 / ((key >> 33) + 1)))
+    return bucket
+
+
+async def lookup_user(email: str) -> tuple[int, int] | None:
+    """Return (user id, shard) for an email, or None if it isn't registered."""
+    conn = await create_or_return_connection(DIRECTORY_SHARD)
+    async with conn.cursor() as cursor:
+        query = """
+            SELECT user_id, shard FROM user_directory
+            WHERE email = %(email)s;
+        """
+        await cursor.execute(query, params={"email": email})
+        row = await cursor.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+async def allocate_user_id() -> int:
+    """User ids come from one sequence so they are unique across shards."""
+    conn = await create_or_return_connection(DIRECTORY_SHARD)
+    async with conn.cursor() as cursor:
+        await cursor.execute("SELECT nextval('user_directory_id_seq');")
+        row = await cursor.fetchone()
+    assert row is not None
+    return row[0]
+
+
+async def register_user(email: str, user_id: int, shard: int) -> None:
+    """Raises psycopg.errors.UniqueViolation if the email is taken."""
+    conn = await create_or_return_connection(DIRECTORY_SHARD)
+    async with conn.cursor() as cursor:
+        query = """
+            INSERT INTO user_directory (email, user_id, shard)
+            VALUES (%(email)s, %(user_id)s, %(shard)s);
+        """
+        await cursor.execute(
+            query, params={"email": email, "user_id": user_id, "shard": shard}
+        )
+
+
+async def move_user(user_id: int, shard: int) -> None:
+    conn = await create_or_return_connection(DIRECTORY_SHARD)
+    async with conn.cursor() as cursor:
+        query = """
+            UPDATE user_directory SET shard = %(shard)s
+            WHERE user_id = %(user_id)s;
+        """
+        await cursor.execute(query, params={"user_id": user_id, "shard": shard})
+
+
+@asynccontextmanager
+async def connect_with_lock(
+    lock_key: int,
+) -> AsyncGenerator[tuple[AsyncCursor[TupleRow], bool], None]:
+    """Try to take a session-level advisory lock on a dedicated connection.
+
+    Yields the cursor and whether the lock was acquired. Advisory locks are
+    re-entrant per session, so the shared connection can't be used here: every
+    caller would "win". The lock lives as long as the connection does.
+    """
+    conn = await _create_connection()
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT pg_try_advisory_lock(%s::bigint)", (lock_key,)
+            )
+            row = await cursor.fetchone()
+            acquired = bool(row and row[0])
+            try:
+                yield cursor, acquired
+            finally:
+                if acquired and not conn.broken:
+                    await cursor.execute(
+                        "SELECT pg_advisory_unlock(%s::bigint)", (lock_key,)
+                    )
+    finally:
+        await conn.close()
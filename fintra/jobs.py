@@ -0,0 +1,107 @@
+import logging
+
+from prometheus_client import Gauge
+
+from fintra import archive, config, db
+from fintra.scheduler import Job, Scheduler
+
+
+logger = logging.getLogger(__name__)
+
+BUDGET_DRIFT = Gauge(
+    "budget_spend_drift_rows", "Month-to-date counters that disagree with transactions"
+)
+
+
+async def analyze_transactions() -> None:
+    """Refresh planner statistics for the hot tables."""
+    for shard in range(len(db.SHARD_URLS)):
+        async with db.dedicated_connection(shard) as conn, conn.cursor() as cursor:
+            await cursor.execute("ANALYZE transactions;")
+            await cursor.execute("ANALYZE users;")
+
+
+async def reconcile_budget_spend() -> None:
+    """Compare this month's spend counters against the transactions table.
+
+    Counters are written in the same statement as the expense, so drift
+    means a bug or a manual edit. It is reported rather than repaired, since
+    overwriting a counter here could race with a concurrent insert.
+    """
+    rows = []
+    for shard in range(len(db.SHARD_URLS)):
+        async with db.dedicated_connection(shard) as conn, conn.cursor() as cursor:
+            query = """
+                WITH actual AS (
+                    SELECT user_id, category, SUM(amount) AS spent
+                    FROM transactions
+                    WHERE type = 'expense'
+                        AND category IS NOT NULL
+                        AND date >= date_trunc('month', now())
+                        AND date < date_trunc('month', now()) + interval '1 month'
+                    GROUP BY user_id, category
+                ),
+                counted AS (
+                    SELECT user_id, category, spent
+                    FROM budget_spend
+                    WHERE month = date_trunc('month', now())::date
+                )
+                SELECT user_id, category, actual.spent, counted.spent
+                FROM actual
+                FULL JOIN counted USING (user_id, category)
+                WHERE actual.spent IS DISTINCT FROM counted.spent;
+            """
+            await cursor.execute(query)
+            rows += await cursor.fetchall()
+    BUDGET_DRIFT.set(len(rows))
+    for user_id, category, actual, counted in rows:
+        logger.warning(
+            "budget spend drift for user %s, category %s: counted %s, actual %s",
+            user_id,
+            category,
+            counted,
+            actual,
+        )
+
+
+async def archive_transactions() -> None:
+    """Move transactions older than ARCHIVE_AFTER_MONTHS out of the hot table."""
+    cutoff = archive.month_start(config.ARCHIVE_AFTER_MONTHS)
+    for shard in range(len(db.SHARD_URLS)):
+        async with db.dedicated_connection(shard) as conn, conn.cursor() as cursor:
+            while await archive.archive_before(
+                cursor, cutoff, config.ARCHIVE_BATCH_SIZE
+            ):
+                pass
+
+
+def create_scheduler() -> Scheduler:
+    scheduler = Scheduler(
+        lock_key=config.SCHEDULER_LOCK_KEY,
+        retry_interval=config.SCHEDULER_RETRY_SECONDS,
+    )
+    scheduler.register(
+        Job(
+            name="analyze-transactions",
+            func=analyze_transactions,
+            interval=config.ANALYZE_INTERVAL_SECONDS,
+            timeout=config.ANALYZE_TIMEOUT_SECONDS,
+        )
+    )
+    scheduler.register(
+        Job(
+            name="reconcile-budget-spend",
+            func=reconcile_budget_spend,
+            interval=config.RECONCILE_INTERVAL_SECONDS,
+            timeout=config.RECONCILE_TIMEOUT_SECONDS,
+        )
+    )
+    scheduler.register(
+        Job(
+            name="archive-transactions",
+            func=archive_transactions,
+            interval=config.ARCHIVE_INTERVAL_SECONDS,
+            timeout=config.ARCHIVE_TIMEOUT_SECONDS,
+        )
+    )
+    return scheduler
@@ -0,0 +1,114 @@
+"""Move users whose directory shard differs from their hash placement.
+
+Run after changing SHARD_URLS, e.g. `python -m fintra.reshard --dry-run`.
+"""
+
+import argparse
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from psycopg import sql
+
+if os.getenv("ENV", "dev") == "dev":
+    load_dotenv(dotenv_path="./.env")
+
+from fintra import db  # noqa: E402
+
+
+# Per-user rows copied along with the users row, in foreign key order. Serial
+# ids are left out on purpose: they are local to each shard.
+USER_TABLES = {
+    "transactions": (
+        "amount", "type", "category", "description", "party", "date", "user_id"
+    ),
+    "budgets": ("user_id", "category", "amount"),
+    "budget_spend": ("user_id", "category", "month", "spent"),
+    "budget_alerts": ("user_id", "category", "month", "threshold", "created_at"),
+    "transactions_archive": (
+        "user_id", "month", "amounts", "types", "categories", "descriptions",
+        "parties", "dates",
+    ),
+    "transaction_summaries": ("user_id", "month", "income", "expense", "count"),
+}
+USER_COLUMNS = ("id", "username", "email", "password", "created_at", "updated_at")
+
+
+def _select(table: str, columns: tuple[str, ...]) -> sql.Composed:
+    # Rows are locked as they are copied, so concurrent updates to them (budget
+    # upserts, spend counters) wait for the move instead of being lost.
+    return sql.SQL("SELECT {} FROM {} WHERE {} = %s FOR UPDATE;").format(
+        sql.SQL(", ").join(map(sql.Identifier, columns)),
+        sql.Identifier(table),
+        sql.Identifier("id" if table == "users" else "user_id"),
+    )
+
+
+def _insert(table: str, columns: tuple[str, ...]) -> sql.Composed:
+    return sql.SQL("INSERT INTO {} ({}) VALUES ({});").format(
+        sql.Identifier(table),
+        sql.SQL(", ").join(map(sql.Identifier, columns)),
+        sql.SQL(", ").join(sql.Placeholder() * len(columns)),
+    )
+
+
+async def move_user(user_id: int, source: int, target: int) -> None:
+    """Copy a user's rows to `target`, repoint the directory, then delete.
+
+    The users row and every copied row stay locked on the source until the
+    move commits. Writes for that user that reach the source during the move
+    either wait on those locks and then fail with ForeignKeyViolation, or
+    arrive after the delete and find no users row. The handlers answer both
+    with a 503 (see `app.user_moved`), so nothing is written on the source
+    and a retry is routed to the target. Clients that don't retry lose that
+    write.
+
+    An interrupted move can be re-run; the target is cleared first. A crash
+    between the directory update and the source commit leaves an orphaned
+    copy on the source.
+    """
+    async with (
+        await db._create_connection(source) as src,
+        await db._create_connection(target) as dst,
+        src.transaction(),
+    ):
+        cursor = await src.execute(_select("users", USER_COLUMNS), (user_id,))
+        if (user := await cursor.fetchone()) is None:
+            return
+
+        async with dst.transaction(), dst.cursor() as out:
+            # Leftovers from an interrupted move; cascades to USER_TABLES.
+            await out.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+            await out.execute(_insert("users", USER_COLUMNS), user)
+            for table, columns in USER_TABLES.items():
+                cursor = await src.execute(_select(table, columns), (user_id,))
+                if rows := await cursor.fetchall():
+                    await out.executemany(_insert(table, columns), rows)
+
+        await db.move_user(user_id, target)
+        await src.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+
+
+async def reshard(dry_run: bool) -> None:
+    conn = await db.create_or_return_connection(db.DIRECTORY_SHARD)
+    async with conn.cursor() as cursor:
+        await cursor.execute("SELECT user_id, shard FROM user_directory;")
+        placements = await cursor.fetchall()
+
+    moves = [
+        (user_id, shard, db.shard_for_user(user_id))
+        for user_id, shard in placements
+        if shard != db.shard_for_user(user_id)
+    ]
+    print(f"{len(moves)} of {len(placements)} users need to move")
+    for user_id, source, target in moves:
+        print(f"user {user_id}: shard {source} -> {target}")
+        if not dry_run:
+            await move_user(user_id, source, target)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true", help="only list moves")
+    args = parser.parse_args()
+    asyncio.run(reshard(dry_run=args.dry_run))
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import random
+import time
+
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import psycopg
+
+from prometheus_client import Counter, Gauge, Summary
+
+from fintra import db
+
+
+logger = logging.getLogger(__name__)
+
+JOB_RUN_TIME = Summary("job_run_seconds", "Background job run duration", ["job"])
+JOB_RUNS = Counter("job_runs", "Background job runs by outcome", ["job", "status"])
+IS_LEADER = Gauge("scheduler_is_leader", "1 if this instance runs background jobs")
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Awaitable[None]]
+    interval: float
+    timeout: float
+    jitter: float = 0.1  # fraction of interval, spreads load across restarts
+
+    def next_delay(self) -> float:
+        spread = self.interval * self.jitter
+        return max(0.0, self.interval + random.uniform(-spread, spread))
+
+
+class Scheduler:
+    """Runs periodic jobs on whichever instance holds the advisory lock.
+
+    Each job has its own loop that awaits a run before sleeping again, so a
+    job never overlaps with itself. Instances that lose the election retry
+    every `retry_interval` seconds and take over if the leader goes away.
+    """
+
+    def __init__(self, lock_key: int, retry_interval: float) -> None:
+        self.lock_key = lock_key
+        self.retry_interval = retry_interval
+        self.jobs: dict[str, Job] = {}
+        self._task: asyncio.Task | None = None
+
+    def register(self, job: Job) -> None:
+        if job.name in self.jobs:
+            raise ValueError(f"job {job.name!r} is already registered")
+        self.jobs[job.name] = job
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._lead(), name="scheduler")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self, job: Job) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(job.func(), timeout=job.timeout)
+        except TimeoutError:
+            JOB_RUNS.labels(job=job.name, status="timeout").inc()
+            logger.warning("job %s timed out after %.1fs", job.name, job.timeout)
+        except Exception:
+            JOB_RUNS.labels(job=job.name, status="error").inc()
+            logger.exception("job %s failed", job.name)
+        else:
+            JOB_RUNS.labels(job=job.name, status="ok").inc()
+        finally:
+            JOB_RUN_TIME.labels(job=job.name).observe(time.perf_counter() - start)
+
+    async def _lead(self) -> None:
+        while True:
+            try:
+                async with db.connect_with_lock(self.lock_key) as (cursor, acquired):
+                    if acquired:
+                        IS_LEADER.set(1)
+                        try:
+                            async with asyncio.TaskGroup() as group:
+                                group.create_task(self._keep_lock(cursor))
+                                for job in self.jobs.values():
+                                    group.create_task(self._loop(job))
+                        finally:
+                            IS_LEADER.set(0)
+            except* psycopg.Error:
+                logger.exception("scheduler lost its database connection")
+            await asyncio.sleep(self.retry_interval)
+
+    async def _keep_lock(self, cursor: psycopg.AsyncCursor) -> None:
+        # The lock dies with the session; raising here cancels the job loops.
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            await cursor.execute("SELECT 1;")
+
+    async def _loop(self, job: Job) -> None:
+        await asyncio.sleep(random.uniform(0, job.interval * job.jitter))
+        while True:
+            await self.run_once(job)
+            await asyncio.sleep(job.next_delay())
@@ -0,0 +1,138 @@
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Any
+
+from psycopg import AsyncCursor
+
+from fintra import config
+from fintra.archive import ARCHIVED_TRANSACTIONS
+
+
+AUTOCOMPLETE_FIELDS = ("category", "party")
+
+# Must match the expression of transactions_search_idx, or the index is skipped.
+SEARCH_DOCUMENT = """
+    coalesce(description, '') || ' ' ||
+    coalesce(party, '') || ' ' ||
+    coalesce(category, '')
+"""
+
+
+def like_pattern(query: str) -> str:
+    """Turn free text into an ILIKE substring pattern, escaping wildcards."""
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+async def search_transactions(
+    cursor: AsyncCursor, email: str, query: str, limit: int
+) -> list[dict[str, Any]]:
+    # Archived rows aren't covered by the trigram index, but they are only
+    # scanned for this one user.
+    sql = f"""
+        WITH u AS (SELECT id FROM users WHERE email = %(email)s)
+        SELECT amount, type, category, description, party, date FROM (
+            SELECT amount, type, category, description, party, date
+            FROM transactions
+            WHERE user_id = (SELECT id FROM u)
+                AND ({SEARCH_DOCUMENT}) ILIKE %(pattern)s
+            UNION ALL
+            SELECT amount, type, category, description, party, date
+            FROM ({ARCHIVED_TRANSACTIONS}
+                WHERE transactions_archive.user_id = (SELECT id FROM u)
+            ) archived
+            WHERE ({SEARCH_DOCUMENT}) ILIKE %(pattern)s
+        ) combined
+        ORDER BY date DESC
+        LIMIT %(limit)s;
+    """
+    await cursor.execute(
+        sql, params={"email": email, "pattern": like_pattern(query), "limit": limit}
+    )
+    return [
+        {
+            "amount": float(amount),
+            "type": _type,
+            "category": category,
+            "description": description,
+            "party": party,
+            "date": date.isoformat(),
+        }
+        for amount, _type, category, description, party, date in await cursor.fetchall()
+    ]
+
+
+class PrefixIndex:
+    """Case-insensitive prefix lookup over a sorted array of distinct values."""
+
+    def __init__(self) -> None:
+        self._keys: list[str] = []
+        self._values: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, value: str) -> None:
+        key = value.casefold()
+        if key in self._values:
+            return
+        insort(self._keys, key)
+        self._values[key] = value
+
+    def complete(self, prefix: str, limit: int = 10) -> list[str]:
+        key = prefix.casefold()
+        matches = []
+        for i in range(bisect_left(self._keys, key), len(self._keys)):
+            if len(matches) >= limit or not self._keys[i].startswith(key):
+                break
+            matches.append(self._values[self._keys[i]])
+        return matches
+
+
+class AutocompleteCache:
+    """Per-user prefix indexes of categories and parties, kept in memory.
+
+    A user's indexes are loaded from the database on first use and then
+    updated by this process's own writes. Least recently used users are
+    evicted once `max_users` is reached.
+    """
+
+    def __init__(self, max_users: int) -> None:
+        self.max_users = max_users
+        self._users: OrderedDict[str, dict[str, PrefixIndex]] = OrderedDict()
+
+    async def get(self, cursor: AsyncCursor, email: str) -> dict[str, PrefixIndex]:
+        if (indexes := self._users.get(email)) is not None:
+            self._users.move_to_end(email)
+            return indexes
+        indexes = {field: PrefixIndex() for field in AUTOCOMPLETE_FIELDS}
+        query = f"""
+            WITH u AS (SELECT id FROM users WHERE email = %(email)s)
+            SELECT DISTINCT category, party FROM transactions
+            WHERE user_id = (SELECT id FROM u)
+            UNION
+            SELECT DISTINCT category, party FROM ({ARCHIVED_TRANSACTIONS}
+                WHERE transactions_archive.user_id = (SELECT id FROM u)
+            ) archived;
+        """
+        await cursor.execute(query, params={"email": email})
+        for category, party in await cursor.fetchall():
+            if category:
+                indexes["category"].add(category)
+            if party:
+                indexes["party"].add(party)
+        self._users[email] = indexes
+        if len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return indexes
+
+    def remember(self, email: str, values: dict[str, Any]) -> None:
+        # Users that aren't loaded yet will pick the value up from the database.
+        if (indexes := self._users.get(email)) is None:
+            return
+        for field in AUTOCOMPLETE_FIELDS:
+            if isinstance(value := values.get(field), str) and value:
+                indexes[field].add(value)
+
+
+autocomplete = AutocompleteCache(max_users=config.AUTOCOMPLETE_MAX_USERS)
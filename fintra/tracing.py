@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+
+from contextvars import ContextVar, Token
+from typing import Any, Protocol
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class _NoopSpan:
+    """Returned by `span` outside a sampled trace; costs one contextvar read."""
+
+    recording = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        return None
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    recording = True
+
+    def __init__(
+        self,
+        name: str,
+        trace: "_Trace",
+        parent_id: str | None,
+        attributes: dict[str, Any],
+    ) -> None:
+        self.name = name
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = 0
+        self.end = 0
+        self.error: str | None = None
+        self._token: Token[Span | None] | None = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.start = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, _tb) -> None:
+        self.end = time.time_ns()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        assert self._token is not None
+        _current_span.reset(self._token)
+        self.trace.finish(self)
+
+
+class _Trace:
+    def __init__(self, trace_id: str) -> None:
+        self.trace_id = trace_id
+        self.spans: list[Span] = []
+        self.root: Span | None = None
+
+    def finish(self, span: Span) -> None:
+        self.spans.append(span)
+        if span is self.root:
+            for exporter in exporters:
+                exporter.export(self.spans)
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def span(name: str, **attributes: Any) -> Span | _NoopSpan:
+    """Open a child of the current span, or do nothing if nothing is traced."""
+    if (parent := _current_span.get()) is None:
+        return _NOOP
+    return Span(name, parent.trace, parent.span_id, attributes)
+
+
+def start_trace(
+    name: str,
+    trace_id: str | None = None,
+    parent_id: str | None = None,
+    **attributes: Any,
+) -> Span:
+    trace = _Trace(trace_id or os.urandom(16).hex())
+    trace.root = Span(name, trace, parent_id, attributes)
+    return trace.root
+
+
+class Exporter(Protocol):
+    """Receives each finished, sampled trace.
+
+    `export` runs on the event loop and must not block. Subclass to inherit
+    the no-op `flush`; exporters that write in the background override it.
+    """
+
+    def export(self, spans: list[Span]) -> None: ...
+
+    async def flush(self) -> None:
+        """Wait for anything exported so far to be written out."""
+        # An explicit body: a docstring alone would make this abstract.
+        return None  # noqa: RET501
+
+
+exporters: list[Exporter] = []
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpJsonFileExporter(Exporter):
+    """Append each trace as one line of OTLP/JSON.
+
+    This is the format read by the OpenTelemetry Collector's `otlpjsonfile`
+    receiver, so traces recorded offline can be replayed into any backend.
+    Finished traces are buffered and written from a thread, so the event
+    loop never blocks on the file.
+    """
+
+    def __init__(self, path: str, service_name: str = "fintra") -> None:
+        self.path = path
+        self.service_name = service_name
+        self._pending: list[list[Span]] = []
+        self._flushing: asyncio.Task | None = None
+
+    def export(self, spans: list[Span]) -> None:
+        self._pending.append(spans)
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.get_running_loop().create_task(self._flush())
+
+    async def flush(self) -> None:
+        if self._flushing is not None:
+            await self._flushing
+
+    async def _flush(self) -> None:
+        while self._pending:
+            traces, self._pending = self._pending, []
+            await asyncio.to_thread(self._write, traces)
+
+    def _write(self, traces: list[list[Span]]) -> None:
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(self._payload(spans)) + "\n" for spans in traces)
+
+    def _payload(self, spans: list[Span]) -> dict[str, Any]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "fintra"},
+                            "spans": [self._span(s) for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    @staticmethod
+    def _span(span: Span) -> dict[str, Any]:
+        result = {
+            "traceId": span.trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 2 if span is span.trace.root else 1,  # SERVER / INTERNAL
+            "startTimeUnixNano": str(span.start),
+            "endTimeUnixNano": str(span.end),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in span.attributes.items()
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            result["parentSpanId"] = span.parent_id
+        return result
+
+
+TRACEPARENT = re.compile(
+    r"([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})", re.IGNORECASE
+)
+
+
+def parse_traceparent(header: str) -> tuple[str, str, bool] | None:
+    """Parse a W3C traceparent header into (trace id, parent id, sampled)."""
+    if (match := TRACEPARENT.fullmatch(header.strip())) is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    # Version ff and all-zero ids are invalid per the spec.
+    if version.lower() == "ff" or int(trace_id, 16) == 0 or int(parent_id, 16) == 0:
+        return None
+    return trace_id.lower(), parent_id.lower(), bool(int(flags, 16) & 1)
+
+
+async def flush() -> None:
+    """Wait for every exporter to catch up, e.g. before shutdown."""
+    for exporter in exporters:
+        await exporter.flush()
+
+
+class TracingMiddleware:
+    """Start a root span per sampled HTTP request.
+
+    An incoming `traceparent` header decides sampling and joins its trace;
+    otherwise requests are sampled at `sample_rate`. With no exporters
+    registered, requests pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not exporters:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = parent_id = None
+        sampled = random.random() < self.sample_rate
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                if parsed := parse_traceparent(value.decode("latin-1")):
+                    trace_id, parent_id, sampled = parsed
+                break
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        root = start_trace(
+            "http.request",
+            trace_id=trace_id,
+            parent_id=parent_id,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+            await send(message)
+
+        with root:
+            await self.app(scope, receive, send_with_status)
@@ -0,0 +1,64 @@
+"""
+create budgets tables
+"""
+
+from yoyo import step
+
+__depends__ = {"20250802_01_NML4q-add-user-id-to-transactions"}
+
+steps = [
+    step(
+        """
+        CREATE TABLE budgets (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            category VARCHAR(50) NOT NULL,
+            amount NUMERIC(10, 2) NOT NULL CHECK (amount > 0),
+            PRIMARY KEY (user_id, category)
+        );
+        """,
+        """
+        DROP TABLE budgets;
+        """,
+    ),
+    step(
+        """
+        CREATE TABLE budget_spend (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            category VARCHAR(50) NOT NULL,
+            month DATE NOT NULL,
+            spent NUMERIC(12, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category, month)
+        );
+        """,
+        """
+        DROP TABLE budget_spend;
+        """,
+    ),
+    step(
+        """
+        INSERT INTO budget_spend (user_id, category, month, spent)
+        SELECT user_id, category, date_trunc('month', date)::date, SUM(amount)
+        FROM transactions
+        WHERE type = 'expense' AND category IS NOT NULL
+        GROUP BY user_id, category, date_trunc('month', date)::date;
+        """,
+        """
+        DELETE FROM budget_spend;
+        """,
+    ),
+    step(
+        """
+        CREATE TABLE budget_alerts (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            category VARCHAR(50) NOT NULL,
+            month DATE NOT NULL,
+            threshold NUMERIC(4, 2) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT current_timestamp,
+            PRIMARY KEY (user_id, category, month, threshold)
+        );
+        """,
+        """
+        DROP TABLE budget_alerts;
+        """,
+    ),
+]
@@ -0,0 +1,38 @@
+"""
+add transaction search indexes
+"""
+
+from yoyo import step
+
+__depends__ = {"20261019_01_Bq7Tn-create-budgets-tables"}
+# CREATE INDEX CONCURRENTLY can't run inside a transaction; it keeps
+# transactions writable while the index builds.
+__transactional__ = False
+
+steps = [
+    step(
+        """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE EXTENSION IF NOT EXISTS btree_gin;
+        """,
+        """
+        DROP EXTENSION IF EXISTS btree_gin;
+        DROP EXTENSION IF EXISTS pg_trgm;
+        """,
+    ),
+    step(
+        """
+        CREATE INDEX CONCURRENTLY transactions_search_idx ON transactions USING GIN (
+            user_id,
+            (
+                coalesce(description, '') || ' ' ||
+                coalesce(party, '') || ' ' ||
+                coalesce(category, '')
+            ) gin_trgm_ops
+        );
+        """,
+        """
+        DROP INDEX CONCURRENTLY transactions_search_idx;
+        """,
+    ),
+]
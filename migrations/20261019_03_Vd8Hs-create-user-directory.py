@@ -0,0 +1,44 @@
+"""
+create user directory
+"""
+
+from yoyo import step
+
+__depends__ = {"20261019_02_Kx3Pw-add-transaction-search-indexes"}
+
+steps = [
+    step(
+        """
+        CREATE TABLE user_directory (
+            email VARCHAR(100) PRIMARY KEY,
+            user_id INTEGER UNIQUE NOT NULL,
+            shard INTEGER NOT NULL
+        );
+        """,
+        """
+        DROP TABLE user_directory;
+        """,
+    ),
+    step(
+        """
+        CREATE SEQUENCE user_directory_id_seq AS INTEGER;
+        SELECT setval(
+            'user_directory_id_seq',
+            COALESCE((SELECT MAX(id) FROM users), 0) + 1,
+            false
+        );
+        """,
+        """
+        DROP SEQUENCE user_directory_id_seq;
+        """,
+    ),
+    step(
+        """
+        INSERT INTO user_directory (email, user_id, shard)
+        SELECT email, id, 0 FROM users;
+        """,
+        """
+        DELETE FROM user_directory;
+        """,
+    ),
+]
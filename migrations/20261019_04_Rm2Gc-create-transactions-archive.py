@@ -0,0 +1,62 @@
+"""
+create transactions archive
+"""
+
+from yoyo import step
+
+__depends__ = {"20261019_03_Vd8Hs-create-user-directory"}
+# CREATE INDEX CONCURRENTLY can't run inside a transaction; it keeps
+# transactions writable while the indexes build.
+__transactional__ = False
+
+steps = [
+    step(
+        """
+        CREATE INDEX CONCURRENTLY transactions_user_date_idx ON transactions (user_id, date);
+        """,
+        """
+        DROP INDEX CONCURRENTLY transactions_user_date_idx;
+        """,
+    ),
+    step(
+        """
+        CREATE INDEX CONCURRENTLY transactions_date_idx ON transactions (date);
+        """,
+        """
+        DROP INDEX CONCURRENTLY transactions_date_idx;
+        """,
+    ),
+    step(
+        """
+        CREATE TABLE transactions_archive (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            month DATE NOT NULL,
+            amounts NUMERIC(10, 2)[] NOT NULL,
+            types transaction_type[] NOT NULL,
+            categories VARCHAR(50)[] NOT NULL,
+            descriptions VARCHAR(200)[] NOT NULL,
+            parties VARCHAR(100)[] NOT NULL,
+            dates TIMESTAMP WITHOUT TIME ZONE[] NOT NULL,
+            PRIMARY KEY (user_id, month)
+        );
+        """,
+        """
+        DROP TABLE transactions_archive;
+        """,
+    ),
+    step(
+        """
+        CREATE TABLE transaction_summaries (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            month DATE NOT NULL,
+            income NUMERIC(14, 2) NOT NULL,
+            expense NUMERIC(14, 2) NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, month)
+        );
+        """,
+        """
+        DROP TABLE transaction_summaries;
+        """,
+    ),
+]
@@ -1,12 +1,3 @@
-function getUserIdentifier() {
-  const cookieString = `; ${document.cookie}`;
-  const parts = cookieString.split(`; email=`);
-  if (parts.length === 2) {
-    const value = parts.pop().split(";").shift();
-    return value.replace(/^"|"$/g, "");
-  }
-}
-
 function getBalance() {
   const balanceDisplay = document.getElementById("balance-display");
   if (!balanceDisplay) {
@@ -68,6 +59,37 @@ function submitTransaction() {
   getBalance();
 }
 
+function suggest(field, input, datalist) {
+  let timer;
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      const params = new URLSearchParams({ field: field, prefix: input.value });
+      fetch(`/transactions/autocomplete?${params}`)
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+          }
+          return response.json();
+        })
+        .then((data) => {
+          datalist.replaceChildren(
+            ...data.suggestions.map((value) => new Option(value)),
+          );
+        })
+        .catch((error) => {
+          console.error("Error fetching suggestions:", error);
+        });
+    }, 150);
+  });
+}
+
+const partyInput = document.getElementById("transactionParty");
+const partySuggestions = document.getElementById("party-suggestions");
+if (partyInput && partySuggestions) {
+  suggest("party", partyInput, partySuggestions);
+}
+
 const submitTransactionForm = document.getElementById(
   "submit-transaction-form",
 );
@@ -82,9 +104,3 @@ const fetchBalanceButton = document.querySelector("button#balance-display-btn");
 if (fetchBalanceButton) {
   fetchBalanceButton.onclick = getBalance;
 }
-window.onload = function () {
-  const displayElement = document.getElementById("username-display");
-  const username = getUserIdentifier();
-  displayElement.textContent = username;
-  getBalance();
-};
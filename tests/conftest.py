@@ -26,11 +26,13 @@ async def event_loop():
 
 @pytest_asyncio.fixture(autouse=True)
 async def setup_database():
-    conn = await db.create_or_return_connection()
+    for shard in range(len(db.SHARD_URLS)):
+        conn = await db.create_or_return_connection(shard)
 
-    async with conn.cursor() as cursor:
-        await cursor.execute("DELETE FROM transactions;")
-        await cursor.execute("DELETE FROM users;")
+        async with conn.cursor() as cursor:
+            await cursor.execute("DELETE FROM transactions;")
+            await cursor.execute("DELETE FROM users;")
+            await cursor.execute("DELETE FROM user_directory;")
     yield
 
 
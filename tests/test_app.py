@@ -163,3 +163,151 @@ async def test_balance_no_transactions(authenticated_client):
     data = response.json()
     assert "balance" in data
     assert data["balance"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_budgets_unauthenticated(async_client: AsyncClient):
+    """Tests that an unauthenticated user cannot view budgets."""
+    response = await async_client.get("/budgets")
+    assert response.status_code == 403  # Forbidden
+
+
+@pytest.mark.asyncio
+async def test_budget_spend_and_alerts(authenticated_client):
+    """Tests that expenses update month-to-date spend and cross thresholds."""
+    client, user_email = authenticated_client
+
+    response = await client.post("/budgets", json={"category": "food", "amount": 100})
+    assert response.status_code == 204
+
+    for amount in (50, 35, 20):
+        expense_data = {
+            "amount": amount,
+            "type": "expense",
+            "category": "food",
+            "description": "Groceries",
+            "party": "Supermarket",
+            "date": datetime.now().isoformat(),
+        }
+        response = await client.post("/transaction", json=expense_data)
+        assert response.status_code == 201
+
+    # Income never counts against a budget
+    income_data = {
+        "amount": 500,
+        "type": "income",
+        "category": "food",
+        "description": "Refund",
+        "party": "Supermarket",
+        "date": datetime.now().isoformat(),
+    }
+    response = await client.post("/transaction", json=income_data)
+    assert response.status_code == 201
+
+    response = await client.get("/budgets")
+    assert response.status_code == 200
+    (budget,) = response.json()["budgets"]
+    assert budget["category"] == "food"
+    assert pytest.approx(budget["spent"]) == 105
+    assert pytest.approx(budget["remaining"]) == -5
+    assert budget["alerts"] == [0.8, 1.0]
+
+
+@pytest.mark.asyncio
+async def test_budget_set_after_spend_catches_up_alerts(authenticated_client):
+    """Tests that thresholds passed before a budget existed are still alerted."""
+    client, user_email = authenticated_client
+    expense_data = {
+        "amount": 90,
+        "type": "expense",
+        "category": "food",
+        "description": "Groceries",
+        "party": "Supermarket",
+        "date": datetime.now().isoformat(),
+    }
+    await client.post("/transaction", json=expense_data)
+    await client.post("/budgets", json={"category": "food", "amount": 100})
+
+    expense_data["amount"] = 5
+    await client.post("/transaction", json=expense_data)
+
+    (budget,) = (await client.get("/budgets")).json()["budgets"]
+    assert pytest.approx(budget["spent"]) == 95
+    assert budget["alerts"] == [0.8]
+
+
+@pytest.mark.asyncio
+async def test_search_and_autocomplete(authenticated_client):
+    """Tests searching transactions and autocompleting parties."""
+    client, user_email = authenticated_client
+
+    for party, description in (
+        ("Corner Bakery", "Bread and 100% rye"),
+        ("Cornwall Rail", "Train ticket"),
+        ("Landlord", "Rent"),
+    ):
+        expense_data = {
+            "amount": 10,
+            "type": "expense",
+            "category": "food",
+            "description": description,
+            "party": party,
+            "date": datetime.now().isoformat(),
+        }
+        response = await client.post("/transaction", json=expense_data)
+        assert response.status_code == 201
+
+    response = await client.get("/transactions/search", params={"q": "corn"})
+    assert response.status_code == 200
+    parties = {t["party"] for t in response.json()["transactions"]}
+    assert parties == {"Corner Bakery", "Cornwall Rail"}
+
+    # Wildcards are matched literally
+    response = await client.get("/transactions/search", params={"q": "100%"})
+    assert [t["party"] for t in response.json()["transactions"]] == ["Corner Bakery"]
+    response = await client.get("/transactions/search", params={"q": "%"})
+    assert len(response.json()["transactions"]) == 1
+
+    # Limits are clamped rather than passed through to Postgres
+    response = await client.get(
+        "/transactions/search", params={"q": "corn", "limit": -1}
+    )
+    assert response.status_code == 200
+    assert len(response.json()["transactions"]) == 1
+
+    response = await client.get(
+        "/transactions/autocomplete", params={"field": "party", "prefix": "cor"}
+    )
+    assert response.status_code == 200
+    assert response.json()["suggestions"] == ["Corner Bakery", "Cornwall Rail"]
+
+    # New values are picked up without reloading from the database
+    expense_data["party"] = "Corner Shop"
+    await client.post("/transaction", json=expense_data)
+    response = await client.get(
+        "/transactions/autocomplete", params={"field": "party", "prefix": "corner"}
+    )
+    assert response.json()["suggestions"] == ["Corner Bakery", "Corner Shop"]
+
+
+@pytest.mark.asyncio
+async def test_dashboard_renders_initial_data(authenticated_client):
+    """Tests that the dashboard arrives with balance and recent transactions."""
+    client, user_email = authenticated_client
+    income_data = {
+        "amount": 120.00,
+        "type": "income",
+        "category": "salary",
+        "description": "Paycheck",
+        "party": "<b>Employer</b>",
+        "date": datetime.now().isoformat(),
+    }
+    await client.post("/transaction", json=income_data)
+
+    response = await client.get("/dashboard")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert user_email in response.text
+    assert "120.0" in response.text
+    assert "&lt;b&gt;Employer&lt;/b&gt;" in response.text
+
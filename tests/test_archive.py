@@ -0,0 +1,62 @@
+import pytest
+
+from datetime import datetime, timedelta
+
+from fintra import db, jobs
+
+
+@pytest.mark.asyncio
+async def test_archived_transactions_stay_visible(authenticated_client):
+    """Tests that archival keeps balance exact and history/search complete."""
+    client, user_email = authenticated_client
+    old = datetime.now() - timedelta(days=3 * 365)
+    for amount, _type, party, when in (
+        (1000, "income", "Old Employer", old),
+        (200, "expense", "Old Landlord", old + timedelta(days=1)),
+        (50, "expense", "Corner Shop", datetime.now()),
+    ):
+        transaction_data = {
+            "amount": amount,
+            "type": _type,
+            "category": "other",
+            "description": "test",
+            "party": party,
+            "date": when.isoformat(),
+        }
+        response = await client.post("/transaction", json=transaction_data)
+        assert response.status_code == 201
+
+    await jobs.archive_transactions()
+
+    found = await db.lookup_user(user_email)
+    assert found is not None
+    user_id, shard = found
+    conn = await db.create_or_return_connection(shard)
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "SELECT count(*) FROM transactions WHERE user_id = %s;", (user_id,)
+        )
+        assert await cursor.fetchone() == (1,)
+
+    response = await client.get("/balance")
+    assert pytest.approx(response.json()["balance"]) == 1000 - 200 - 50
+
+    response = await client.get("/transactions")
+    parties = [t["party"] for t in response.json()["transactions"]]
+    assert parties == ["Corner Shop", "Old Landlord", "Old Employer"]
+
+    response = await client.get(
+        "/transactions",
+        params={
+            "start": (old - timedelta(days=1)).isoformat(),
+            "end": (old + timedelta(hours=1)).isoformat(),
+        },
+    )
+    assert [t["party"] for t in response.json()["transactions"]] == ["Old Employer"]
+
+    response = await client.get("/transactions/search", params={"q": "landlord"})
+    assert [t["party"] for t in response.json()["transactions"]] == ["Old Landlord"]
+
+    response = await client.get("/transactions", params={"limit": -1})
+    assert response.status_code == 200
+    assert [t["party"] for t in response.json()["transactions"]] == ["Corner Shop"]
@@ -0,0 +1,44 @@
+import statistics
+import time
+
+import pytest
+
+from datetime import datetime
+
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.mark.asyncio
+async def test_dashboard_time_to_interactive(authenticated_client):
+    """Reports how long a fully populated dashboard takes to arrive.
+
+    The page needs no follow-up requests, so time to interactive is the time
+    to read the whole streamed response. Run with `pytest -m benchmark -s`.
+    """
+    client, user_email = authenticated_client
+    for i in range(50):
+        expense_data = {
+            "amount": 1 + i,
+            "type": "expense",
+            "category": "food",
+            "description": "Lunch",
+            "party": f"Cafe {i}",
+            "date": datetime.now().isoformat(),
+        }
+        await client.post("/transaction", json=expense_data)
+
+    timings = []
+    for _ in range(50):
+        start = time.perf_counter()
+        response = await client.get("/dashboard")
+        assert response.status_code == 200
+        assert "Cafe 49" in response.text
+        timings.append(time.perf_counter() - start)
+
+    p50 = statistics.median(timings)
+    p95 = statistics.quantiles(timings, n=20)[-1]
+    print(
+        f"\n/dashboard time to interactive: "
+        f"p50 {p50 * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms"
+    )
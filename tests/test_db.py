@@ -0,0 +1,93 @@
+import pytest
+
+from fintra import db
+
+
+@pytest.fixture()
+def slow_queries():
+    """Log every statement and explain all of them."""
+    log = db.slow_queries
+    threshold, explain_rate = log.threshold, log.explain_rate
+    log.threshold, log.explain_rate = 0.0, 1.0
+    log.entries.clear()
+    yield log
+    log.threshold, log.explain_rate = threshold, explain_rate
+
+
+@pytest.mark.asyncio
+async def test_slow_query_is_logged_and_explained(slow_queries):
+    """Tests that slow statements are recorded by shape and sampled for plans."""
+    conn = await db.create_or_return_connection()
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "SELECT email FROM users WHERE email = %(email)s;",
+            params={"email": "secret@example.com"},
+        )
+    await slow_queries._explain_task
+
+    entry = slow_queries.entries[-1]
+    assert entry.statement == "SELECT email FROM users WHERE email = %(email)s;"
+    assert entry.params == {"email": "str"}
+    assert entry.plan is not None
+    assert "Buffers" in entry.plan or "actual time" in entry.plan
+
+
+@pytest.mark.asyncio
+async def test_explain_does_not_repeat_writes(slow_queries):
+    """Tests that an INSERT is planned but never executed again."""
+    conn = await db.create_or_return_connection()
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "INSERT INTO users (email, password) VALUES (%(email)s, 'x');",
+            params={"email": "explained@example.com"},
+        )
+        await slow_queries._explain_task
+        # Nothing unique here, so a second execution would show in the count.
+        await cursor.execute(
+            """
+            INSERT INTO transactions (amount, type, user_id)
+            SELECT 10, 'expense', id FROM users WHERE email = %(email)s;
+            """,
+            params={"email": "explained@example.com"},
+        )
+        entry = slow_queries.entries[-1]
+        await slow_queries._explain_task
+        assert entry.plan is not None
+        assert not entry.plan.startswith("EXPLAIN failed")
+        assert "Insert on transactions" in entry.plan
+        assert "actual time" not in entry.plan
+        await cursor.execute(
+            """
+            SELECT count(*) FROM transactions
+            JOIN users ON users.id = transactions.user_id
+            WHERE users.email = %(email)s;
+            """,
+            params={"email": "explained@example.com"},
+        )
+        assert await cursor.fetchone() == (1,)
+
+
+@pytest.mark.asyncio
+async def test_slow_queries_requires_debug_scope(authenticated_client):
+    """Tests that regular users can't read the slow query log."""
+    client, user_email = authenticated_client
+    response = await client.get("/debug/slow-queries")
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_pool_replaces_dead_connections():
+    """Tests that idle connections are checked and closed with the pool."""
+    pool = db.ConnectionPool(db.DIRECTORY_SHARD, size=1)
+    async with pool.connection() as conn:
+        pid = conn.info.backend_pid
+    # What a database restart does to every idle connection.
+    shared = await db.create_or_return_connection()
+    await shared.execute("SELECT pg_terminate_backend(%s);", (pid,))
+
+    async with pool.connection() as conn:
+        cursor = await conn.execute("SELECT 1;")
+        assert await cursor.fetchone() == (1,)
+        assert conn.info.backend_pid != pid
+        await pool.close()
+    assert conn.closed
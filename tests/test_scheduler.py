@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from fintra import db
+from fintra.scheduler import JOB_RUNS, Job, Scheduler
+
+
+@pytest.mark.asyncio
+async def test_connect_with_lock_single_winner():
+    """Tests that only one session can hold the advisory lock at a time."""
+    async with (
+        db.connect_with_lock(4242) as (_, first),
+        db.connect_with_lock(4242) as (_, second),
+    ):
+        assert first is True
+        assert second is False
+    async with db.connect_with_lock(4242) as (_, again):
+        assert again is True
+
+
+@pytest.mark.asyncio
+async def test_run_once_times_out():
+    """Tests that a job exceeding its timeout is cancelled and counted."""
+
+    async def slow() -> None:
+        await asyncio.sleep(10)
+
+    job = Job(name="test-slow", func=slow, interval=60, timeout=0.01)
+    scheduler = Scheduler(lock_key=4243, retry_interval=1)
+    await scheduler.run_once(job)
+    assert JOB_RUNS.labels(job="test-slow", status="timeout")._value.get() == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_jobs_only_when_leader():
+    """Tests that a scheduler runs its jobs only while holding the lock."""
+    runs = 0
+
+    async def count() -> None:
+        nonlocal runs
+        runs += 1
+
+    scheduler = Scheduler(lock_key=4244, retry_interval=0.05)
+    scheduler.register(Job(name="test-count", func=count, interval=0.01, timeout=1))
+
+    async with db.connect_with_lock(4244) as (_, acquired):
+        assert acquired
+        await scheduler.start()
+        await asyncio.sleep(0.1)
+        assert runs == 0
+
+    await asyncio.sleep(0.3)
+    await scheduler.stop()
+    assert runs > 0
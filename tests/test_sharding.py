@@ -0,0 +1,118 @@
+import pytest
+
+from datetime import datetime
+from httpx import AsyncClient
+
+from fintra import db, reshard
+
+
+requires_shards = pytest.mark.skipif(
+    len(db.SHARD_URLS) < 2, reason="needs SHARD_URLS with at least two databases"
+)
+
+
+def test_shard_for_user_is_stable_and_spread():
+    """Tests that hash placement is deterministic and uses every shard."""
+    placements = [db.shard_for_user(user_id, shards=4) for user_id in range(1, 200)]
+    assert placements == [
+        db.shard_for_user(user_id, shards=4) for user_id in range(1, 200)
+    ]
+    assert set(placements) == {0, 1, 2, 3}
+
+
+def test_adding_a_shard_moves_few_users():
+    """Tests that growing from 4 to 5 shards only moves users to the new one."""
+    user_ids = range(1, 5001)
+    moved = [
+        user_id
+        for user_id in user_ids
+        if db.shard_for_user(user_id, shards=4) != db.shard_for_user(user_id, shards=5)
+    ]
+    assert 0.15 < len(moved) / len(user_ids) < 0.25
+    assert {db.shard_for_user(user_id, shards=5) for user_id in moved} == {4}
+
+
+async def _shards_with_user(email: str) -> list[int]:
+    shards = []
+    for shard in range(len(db.SHARD_URLS)):
+        conn = await db.create_or_return_connection(shard)
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT 1 FROM users WHERE email = %(email)s;", params={"email": email}
+            )
+            if await cursor.fetchone():
+                shards.append(shard)
+    return shards
+
+
+@requires_shards
+@pytest.mark.asyncio
+async def test_users_are_placed_by_hash(async_client: AsyncClient):
+    """Tests that new users land only on the shard their id hashes to."""
+    for i in range(6):
+        email = f"shard{i}@example.com"
+        await async_client.post(
+            "/create-user", data={"email": email, "password": "password123"}
+        )
+        found = await db.lookup_user(email)
+        assert found is not None
+        user_id, shard = found
+        assert shard == db.shard_for_user(user_id)
+        assert await _shards_with_user(email) == [shard]
+
+
+@requires_shards
+@pytest.mark.asyncio
+async def test_move_user_keeps_data(authenticated_client):
+    """Tests that resharding moves a user's rows and repoints the directory."""
+    client, user_email = authenticated_client
+    await client.post("/budgets", json={"category": "food", "amount": 100})
+    expense_data = {
+        "amount": 40,
+        "type": "expense",
+        "category": "food",
+        "description": "Groceries",
+        "party": "Supermarket",
+        "date": datetime.now().isoformat(),
+    }
+    await client.post("/transaction", json=expense_data)
+
+    found = await db.lookup_user(user_email)
+    assert found is not None
+    user_id, source = found
+    target = (source + 1) % len(db.SHARD_URLS)
+    await reshard.move_user(user_id, source, target)
+
+    assert await db.lookup_user(user_email) == (user_id, target)
+    assert await _shards_with_user(user_email) == [target]
+    response = await client.get("/balance")
+    assert pytest.approx(response.json()["balance"]) == -40
+    (budget,) = (await client.get("/budgets")).json()["budgets"]
+    assert pytest.approx(budget["spent"]) == 40
+
+
+@pytest.mark.asyncio
+async def test_write_after_move_is_retryable(authenticated_client):
+    """Tests that writes routed to a shard the user just left aren't dropped."""
+    client, user_email = authenticated_client
+    found = await db.lookup_user(user_email)
+    assert found is not None
+    user_id, shard = found
+    # What a request sees if it resolved the shard before a move committed.
+    conn = await db.create_or_return_connection(shard)
+    async with conn.cursor() as cursor:
+        await cursor.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+
+    expense_data = {
+        "amount": 40,
+        "type": "expense",
+        "category": "food",
+        "description": "Groceries",
+        "party": "Supermarket",
+        "date": datetime.now().isoformat(),
+    }
+    response = await client.post("/transaction", json=expense_data)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    response = await client.post("/budgets", json={"category": "food", "amount": 100})
+    assert response.status_code == 503
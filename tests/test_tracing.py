@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from fintra import tracing
+
+
+class ListExporter(tracing.Exporter):
+    def __init__(self) -> None:
+        self.traces: list[list[tracing.Span]] = []
+
+    def export(self, spans: list[tracing.Span]) -> None:
+        self.traces.append(list(spans))
+
+
+@pytest.fixture()
+def exporter():
+    exporter = ListExporter()
+    tracing.exporters.append(exporter)
+    yield exporter
+    tracing.exporters.remove(exporter)
+
+
+def test_span_outside_trace_is_noop():
+    """Tests that spans are free when no trace is active."""
+    with tracing.span("nothing") as span:
+        assert not span.recording
+
+
+@pytest.mark.asyncio
+async def test_request_span_tree(authenticated_client, exporter):
+    """Tests that auth, handler and DB spans nest under the request span."""
+    client, user_email = authenticated_client
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    response = await client.get(
+        "/balance", headers={"traceparent": f"00-{trace_id}-b7ad6b7169203331-01"}
+    )
+    assert response.status_code == 200
+
+    (spans,) = exporter.traces
+    by_name = {span.name: span for span in spans}
+    root = by_name["http.request"]
+    assert root.trace.trace_id == trace_id
+    assert root.parent_id == "b7ad6b7169203331"
+    assert root.attributes["http.status_code"] == 200
+    assert by_name["auth.authenticate"].parent_id == root.span_id
+    assert by_name["handler.balance"].parent_id == root.span_id
+    db_spans = [span for span in spans if span.name == "db.execute"]
+    assert {span.parent_id for span in db_spans} == {
+        by_name["auth.authenticate"].span_id,
+        by_name["handler.balance"].span_id,
+    }
+
+
+@pytest.mark.asyncio
+async def test_unsampled_request_is_not_traced(authenticated_client, exporter):
+    """Tests that a traceparent without the sampled flag is respected."""
+    client, user_email = authenticated_client
+    await client.get(
+        "/balance",
+        headers={"traceparent": "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00"},
+    )
+    assert exporter.traces == []
+
+
+def test_parse_traceparent_rejects_invalid_ids():
+    """Tests that malformed headers, version ff and all-zero ids are ignored."""
+    span_id = "b7ad6b7169203331"
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    assert tracing.parse_traceparent(f"00-{trace_id}-{span_id}-01") == (
+        trace_id,
+        span_id,
+        True,
+    )
+    assert tracing.parse_traceparent(f"00-{'g' * 32}-{span_id}-01") is None
+    assert tracing.parse_traceparent(f"00-{'0' * 32}-{span_id}-01") is None
+    assert tracing.parse_traceparent(f"00-{trace_id}-{'0' * 16}-01") is None
+    assert tracing.parse_traceparent(f"00-0x{'a' * 30}-{span_id}-01") is None
+    assert tracing.parse_traceparent(f"00-{'a' * 30}_a-{span_id}-01") is None
+    assert tracing.parse_traceparent(f"00-+{'a' * 31}-{span_id}-01") is None
+    assert tracing.parse_traceparent(f"ff-{trace_id}-{span_id}-01") is None
+    assert tracing.parse_traceparent(f"00-{trace_id}-{span_id}-001") is None
+    assert tracing.parse_traceparent(f"00-{trace_id.upper()}-{span_id}-01") == (
+        trace_id,
+        span_id,
+        True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_otlp_file_exporter_writes_in_background(tmp_path):
+    """Tests that exported traces reach the file once flushed."""
+    path = tmp_path / "traces.jsonl"
+    exporter = tracing.OtlpJsonFileExporter(str(path))
+    tracing.exporters.append(exporter)
+    try:
+        with tracing.start_trace("root"), tracing.span("child"):
+            pass
+        await exporter.flush()
+    finally:
+        tracing.exporters.remove(exporter)
+
+    (line,) = path.read_text().splitlines()
+    spans = json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["child", "root"]